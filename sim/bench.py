@@ -0,0 +1,55 @@
+"""
+Time the bubble sort workload on each available simulator core.
+
+    python sim/bench.py
+
+The Cython core is included when decode_core has been built, and the
+Numba loop when jit imports (NumPy installed).
+"""
+
+import timeit
+
+import bubble
+import decode
+
+MAX_CYCLES = 5000
+REPEAT = 5
+TEST_ARRAY = [0x7, 0x2, 0x9, 0x1, 0x5]
+
+
+def available_cores():
+    """(name, cpu class, runner) for every core that can be imported"""
+    cores = [("python", decode.RISC4, bubble.run)]
+    try:
+        import decode_core
+    except ImportError:
+        pass
+    else:
+        cores.append(("cython", decode_core.RISC4, bubble.run))
+    try:
+        from jit import sim_run
+    except ImportError:
+        pass
+    else:
+        cores.append(("numba", decode.RISC4, sim_run))
+    return cores
+
+
+def bench(cpu_class, runner):
+    """Best-of-REPEAT seconds for one MAX_CYCLES bubble sort run"""
+    program, _ = bubble.assemble_bubble_sort()
+    cpu = cpu_class()
+
+    def once():
+        cpu.reset()
+        bubble.load_program(cpu, program)
+        bubble.load_data_nibbles(cpu, 0x40, TEST_ARRAY)
+        runner(cpu, MAX_CYCLES, 0x18)
+
+    once()  # Warm up: JIT compilation and the decode cache
+    return min(timeit.repeat(once, number=1, repeat=REPEAT))
+
+
+if __name__ == "__main__":
+    for name, cpu_class, runner in available_cores():
+        print(f"{name:<8} {bench(cpu_class, runner) * 1e3:8.3f} ms")
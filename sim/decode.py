@@ -6,295 +6,379 @@ M-Type:  [opcode:4][rd/rs:4][base:4][offset4:4]
 J-Type:  [opcode:4][target12:12]
 """
 
+import struct
+from array import array
 
+
+# Per-format field decoders for tools and tests. The opcode is not
+# returned: callers already have it from dispatch. Execution goes through
+# decode_fields() once per distinct instruction word instead.
 def decode_r_type(instr):
-    op_code = (instr >> 12) & 0xF
     rd = (instr >> 8) & 0xF
     rs = (instr >> 4) & 0xF
     rt = instr & 0xF
-    return op_code, rd, rs, rt
+    return rd, rs, rt
 
 
 def decode_i_type(instr):
-    op_code = (instr >> 12) & 0xF
     rd = (instr >> 8) & 0xF
     rs = (instr >> 4) & 0xF
     imm4 = instr & 0xF
-    return op_code, rd, rs, imm4
+    return rd, rs, imm4
 
 
 def decode_branch_type(instr):
-    op_code = (instr >> 12) & 0xF
     cond = (instr >> 8) & 0xF
     offset = instr & 0xFF
-    return op_code, cond, offset
+    return cond, offset
 
 
 def decode_m_type(instr):
-    op_code = (instr >> 12) & 0xF
     rd_rs = (instr >> 8) & 0xF
     base = (instr >> 4) & 0xF
     offset = instr & 0xF
-    return op_code, rd_rs, base, offset
+    return rd_rs, base, offset
 
 
 def decode_j_type(instr):
-    op_code = (instr >> 12) & 0xF
     target = instr & 0xFFF
-    return op_code, target
+    return target
+
+
+def decode_fields(instr):
+    """Split an instruction into its four nibbles: (op, a, b, c)"""
+    return (instr >> 12) & 0xF, (instr >> 8) & 0xF, (instr >> 4) & 0xF, instr & 0xF
+
+
+def pack_fields(op, a, b, c):
+    """Pack four nibbles into an instruction word, inverse of decode_fields()"""
+    return ((op & 0xF) << 12) | ((a & 0xF) << 8) | ((b & 0xF) << 4) | (c & 0xF)
 
 
 def sign_extend_4bit(val):
     """Sign-extend 4-bit value to Python int"""
-    if val & 0x8:
-        return val | 0xFFFFFFF0
-    return val
+    return (val ^ 0x8) - 0x8
 
 
 def sign_extend_8bit(val):
     """Sign-extend 8-bit value to Python int"""
-    if val & 0x80:
-        return val | 0xFFFFFF00
-    return val
+    return (val ^ 0x80) - 0x80
+
+
+# Instructions are stored big-endian, one 16-bit word per 2 bytes
+INSTR_WORD = struct.Struct(">H")
+
+# CPU state slots: r0-r15 live in state[0:16], followed by these
+PC = 16
+FLAG_C = 17
+FLAG_Z = 18
+ZERO_SINK = 19  # r0 is hardwired to zero: its writes land here instead
+STATE_SIZE = 20
+
+_WRITE_SLOT = (ZERO_SINK,) + tuple(range(1, 16))
+
+
+def _build_shf_table():
+    """Precompute SHF as (carry << 4) | result, indexed by (imm4 << 4) | rs"""
+    table = []
+    for imm4 in range(16):
+        shift_amt = imm4 & 0x7
+        for rs_val in range(16):
+            if imm4 & 0x8:  # Right shift: C = last bit shifted out of bit 0
+                result = rs_val >> shift_amt
+                carry = ((rs_val << 1) >> shift_amt) & 1
+            else:  # Left shift: C = last bit shifted out of bit 3
+                shifted = rs_val << shift_amt
+                result = shifted & 0xF
+                carry = (shifted >> 4) & 1
+            table.append((carry << 4) | result)
+    return tuple(table)
+
+
+_SHF_TABLE = _build_shf_table()
 
 
 class RISC4:
     def __init__(self, mem_size=4096):
-        self.reg = [0] * 16
-        self.pc = 0
-        self.flag_c = False
-        self.flag_z = False
+        # Registers, PC and flags share one contiguous uint16 buffer
+        self.state = array("H", bytes(2 * STATE_SIZE))
+        self.reg = memoryview(self.state)[:16]
         self.memory = bytearray(mem_size)
 
-        self.dispatch = {
-            0x0: self.exec_add,
-            0x1: self.exec_sub,
-            0x2: self.exec_and,
-            0x3: self.exec_or,
-            0x4: self.exec_xor,
-            0x5: self.exec_slt,
-            0x6: self.exec_shf,
-            0x7: self.exec_ext,
-            0x8: self.exec_addi,
-            0x9: self.exec_andi,
-            0xA: self.exec_ori,
-            0xB: self.exec_slti,
-            0xC: self.exec_lw,
-            0xD: self.exec_sw,
-            0xE: self.exec_branch,
-            0xF: self.exec_jump,
-        }
+        # Read-only program image seen by fetch at byte addresses
+        # [rom_base, rom_end); loads and stores still go to memory
+        self.rom = memoryview(b"")
+        self.rom_base = 0
+        self.rom_end = 0
+
+        # (handler, a, b, c) per instruction word, filled on first execution.
+        # Keyed by the word rather than its address, so stores never stale it.
+        self.decoded = [None] * 0x10000
+
+        # Indexed directly by the 4-bit opcode
+        self.dispatch = (
+            self.exec_add,  # 0x0
+            self.exec_sub,  # 0x1
+            self.exec_and,  # 0x2
+            self.exec_or,  # 0x3
+            self.exec_xor,  # 0x4
+            self.exec_slt,  # 0x5
+            self.exec_shf,  # 0x6
+            self.exec_ext,  # 0x7
+            self.exec_addi,  # 0x8
+            self.exec_andi,  # 0x9
+            self.exec_ori,  # 0xA
+            self.exec_slti,  # 0xB
+            self.exec_lw,  # 0xC
+            self.exec_sw,  # 0xD
+            self.exec_branch,  # 0xE
+            self.exec_jump,  # 0xF
+        )
+
+        # EXT sub-operations, indexed by the funct nibble
+        self.ext_dispatch = (
+            self.exec_adc,  # 0x0
+            self.exec_sbb,  # 0x1
+            self.exec_neg,  # 0x2
+            self.exec_jr,  # 0x3
+        ) + (self.exec_ext_unknown,) * 12
+
+    @property
+    def pc(self):
+        return self.state[PC]
+
+    @pc.setter
+    def pc(self, value):
+        self.state[PC] = value
+
+    @property
+    def flag_c(self):
+        return self.state[FLAG_C]
+
+    @flag_c.setter
+    def flag_c(self, value):
+        self.state[FLAG_C] = value
+
+    @property
+    def flag_z(self):
+        return self.state[FLAG_Z]
+
+    @flag_z.setter
+    def flag_z(self, value):
+        self.state[FLAG_Z] = value
+
+    def reset(self):
+        """Zero registers, PC, flags and memory in place"""
+        self.state[:] = array("H", bytes(2 * STATE_SIZE))
+        self.memory[:] = bytes(len(self.memory))
+        self.attach_rom(b"")
+
+    def attach_rom(self, image, base=0):
+        """Fetch instructions straight from a packed program image.
+
+        The image is not copied into memory, so it must not need to be
+        modified by the program it holds.
+        """
+        self.rom = memoryview(image)
+        self.rom_base = base
+        self.rom_end = base + len(self.rom)
 
     def fetch(self):
-        byte_addr = self.pc // 2
-        instr = (self.memory[byte_addr] << 8) | self.memory[byte_addr + 1]
-        self.pc += 4  # Move forward 1 instruction (4 nibbles)
+        s = self.state
+        addr = s[PC] >> 1
+        if self.rom_base <= addr < self.rom_end - 1:
+            instr = INSTR_WORD.unpack_from(self.rom, addr - self.rom_base)[0]
+        else:
+            instr = INSTR_WORD.unpack_from(self.memory, addr)[0]
+        s[PC] += 4  # Move forward 1 instruction (4 nibbles)
         return instr
 
+    def predecode(self, instr):
+        """Resolve an instruction word to its (handler, a, b, c) entry"""
+        op, a, b, c = decode_fields(instr)
+        # EXT resolves straight to its sub-operation
+        handler = self.ext_dispatch[c] if op == 0x7 else self.dispatch[op]
+        entry = self.decoded[instr] = (handler, a, b, c)
+        return entry
+
     def decode_and_execute(self, instr):
-        op_code = (instr >> 12) & 0xF
-        exec_func = self.dispatch.get(op_code)
-        if exec_func:
-            exec_func(instr)
-        else:
-            raise ValueError(f"Unknown Instruction: {op_code:X}")
-
-    def write_reg(self, rd, value):
-        if rd != 0:
-            self.reg[rd] = value & 0xF
-
-    def get_pair_value(self, base):
-        """Get 8-bit value from register pair"""
-        high = self.reg[base]
-        low = self.reg[base + 1]
-        return (high << 4) | low
-
-    def exec_add(self, instr):
-        _, rd, rs, rt = decode_r_type(instr)
-        result = self.reg[rs] + self.reg[rt]
-        self.flag_c = result > 0xF
+        handler, a, b, c = self.decoded[instr] or self.predecode(instr)
+        handler(a, b, c)
+
+    def exec_add(self, rd, rs, rt):
+        s = self.state
+        result = s[rs] + s[rt]
+        s[FLAG_C] = (result >> 4) & 1
         result &= 0xF
-        self.flag_z = result == 0
-        self.write_reg(rd, result)
+        s[FLAG_Z] = result == 0
+        s[_WRITE_SLOT[rd]] = result
 
-    def exec_sub(self, instr):
-        _, rd, rs, rt = decode_r_type(instr)
-        result = self.reg[rs] - self.reg[rt]
-        self.flag_c = result < 0
+    def exec_sub(self, rd, rs, rt):
+        s = self.state
+        result = s[rs] - s[rt]
+        s[FLAG_C] = (result >> 4) & 1  # Borrow: negative results shift in 1s
         result &= 0xF
-        self.flag_z = result == 0
-        self.write_reg(rd, result)
-
-    def exec_and(self, instr):
-        _, rd, rs, rt = decode_r_type(instr)
-        result = self.reg[rs] & self.reg[rt]
-        self.flag_c = False
-        self.flag_z = result == 0
-        self.write_reg(rd, result)
-
-    def exec_or(self, instr):
-        _, rd, rs, rt = decode_r_type(instr)
-        result = self.reg[rs] | self.reg[rt]
-        self.flag_c = False
-        self.flag_z = result == 0
-        self.write_reg(rd, result)
-
-    def exec_xor(self, instr):
-        _, rd, rs, rt = decode_r_type(instr)
-        result = self.reg[rs] ^ self.reg[rt]
-        self.flag_c = False
-        self.flag_z = result == 0
-        self.write_reg(rd, result)
-
-    def exec_slt(self, instr):
+        s[FLAG_Z] = result == 0
+        s[_WRITE_SLOT[rd]] = result
+
+    def exec_and(self, rd, rs, rt):
+        s = self.state
+        result = s[rs] & s[rt]
+        s[FLAG_C] = 0
+        s[FLAG_Z] = result == 0
+        s[_WRITE_SLOT[rd]] = result
+
+    def exec_or(self, rd, rs, rt):
+        s = self.state
+        result = s[rs] | s[rt]
+        s[FLAG_C] = 0
+        s[FLAG_Z] = result == 0
+        s[_WRITE_SLOT[rd]] = result
+
+    def exec_xor(self, rd, rs, rt):
+        s = self.state
+        result = s[rs] ^ s[rt]
+        s[FLAG_C] = 0
+        s[FLAG_Z] = result == 0
+        s[_WRITE_SLOT[rd]] = result
+
+    def exec_slt(self, rd, rs, rt):
         """Signed less-than comparison"""
-        _, rd, rs, rt = decode_r_type(instr)
-        rs_val = self.reg[rs]
-        rt_val = self.reg[rt]
+        s = self.state
+        rs_val = s[rs]
+        rt_val = s[rt]
         # Convert to signed
         rs_signed = rs_val if rs_val < 8 else rs_val - 16
         rt_signed = rt_val if rt_val < 8 else rt_val - 16
         result = 1 if rs_signed < rt_signed else 0
-        self.flag_c = False
-        self.flag_z = result == 0
-        self.write_reg(rd, result)
+        s[FLAG_C] = 0
+        s[FLAG_Z] = result == 0
+        s[_WRITE_SLOT[rd]] = result
 
-    def exec_shf(self, instr):
+    def exec_shf(self, rd, rs, imm4):
         """Shift left/right"""
-        _, rd, rs, imm4 = decode_i_type(instr)
-        rs_val = self.reg[rs]
-        shift_dir = (imm4 >> 3) & 1
-        shift_amt = imm4 & 0x7
-
-        if shift_dir == 0:  # Left shift
-            if shift_amt > 0:
-                self.flag_c = bool((rs_val >> (4 - shift_amt)) & 1)
-                result = (rs_val << shift_amt) & 0xF
-            else:
-                result = rs_val
-                self.flag_c = False
-        else:  # Right shift
-            if shift_amt > 0:
-                self.flag_c = bool((rs_val >> (shift_amt - 1)) & 1)
-                result = rs_val >> shift_amt
-            else:
-                result = rs_val
-                self.flag_c = False
-
-        self.flag_z = result == 0
-        self.write_reg(rd, result)
-
-    def exec_ext(self, instr):
+        s = self.state
+        packed = _SHF_TABLE[(imm4 << 4) | s[rs]]
+        s[FLAG_C] = packed >> 4
+        result = packed & 0xF
+        s[FLAG_Z] = result == 0
+        s[_WRITE_SLOT[rd]] = result
+
+    def exec_ext(self, rd, rs, funct):
         """Extended operations: ADC, SBB, NEG, JR"""
-        _, rd, rs, funct = decode_r_type(instr)
-
-        if funct == 0x0:  # ADC
-            result = self.reg[rd] + self.reg[rs] + (1 if self.flag_c else 0)
-            self.flag_c = result > 0xF
-            result &= 0xF
-            self.flag_z = result == 0
-            self.write_reg(rd, result)
-
-        elif funct == 0x1:  # SBB
-            result = self.reg[rd] - self.reg[rs] - (1 if self.flag_c else 0)
-            self.flag_c = result < 0
-            result &= 0xF
-            self.flag_z = result == 0
-            self.write_reg(rd, result)
-
-        elif funct == 0x2:  # NEG
-            result = (0 - self.reg[rs]) & 0xF
-            self.flag_c = self.reg[rs] != 0
-            self.flag_z = result == 0
-            self.write_reg(rd, result)
-
-        elif funct == 0x3:  # JR
-            target = (self.reg[1] << 8) | (self.reg[2] << 4) | self.reg[3]
-            self.pc = (target & 0xFFF) * 4  # Convert to nibble address
+        self.ext_dispatch[funct](rd, rs, funct)
 
-        else:
-            raise ValueError(f"Unknown EXT function: {funct:X}")
+    def exec_adc(self, rd, rs, funct):
+        s = self.state
+        result = s[rd] + s[rs] + s[FLAG_C]
+        s[FLAG_C] = (result >> 4) & 1
+        result &= 0xF
+        s[FLAG_Z] = result == 0
+        s[_WRITE_SLOT[rd]] = result
 
-    def exec_addi(self, instr):
-        _, rd, rs, imm4 = decode_i_type(instr)
+    def exec_sbb(self, rd, rs, funct):
+        s = self.state
+        result = s[rd] - s[rs] - s[FLAG_C]
+        s[FLAG_C] = (result >> 4) & 1
+        result &= 0xF
+        s[FLAG_Z] = result == 0
+        s[_WRITE_SLOT[rd]] = result
+
+    def exec_neg(self, rd, rs, funct):
+        s = self.state
+        result = (0 - s[rs]) & 0xF
+        s[FLAG_C] = s[rs] != 0
+        s[FLAG_Z] = result == 0
+        s[_WRITE_SLOT[rd]] = result
+
+    def exec_jr(self, rd, rs, funct):
+        s = self.state
+        target = (s[1] << 8) | (s[2] << 4) | s[3]
+        s[PC] = (target & 0xFFF) * 4  # Convert to nibble address
+
+    def exec_ext_unknown(self, rd, rs, funct):
+        raise ValueError(f"Unknown EXT function: {funct:X}")
+
+    def exec_addi(self, rd, rs, imm4):
+        s = self.state
         imm_signed = sign_extend_4bit(imm4)
-        result = self.reg[rs] + imm_signed
-        self.flag_c = result > 0xF or result < 0
+        result = s[rs] + imm_signed
+        s[FLAG_C] = (result >> 4) & 1
         result &= 0xF
-        self.flag_z = result == 0
-        self.write_reg(rd, result)
-
-    def exec_andi(self, instr):
-        _, rd, rs, imm4 = decode_i_type(instr)
-        result = self.reg[rs] & imm4
-        self.flag_c = False
-        self.flag_z = result == 0
-        self.write_reg(rd, result)
-
-    def exec_ori(self, instr):
-        _, rd, rs, imm4 = decode_i_type(instr)
-        result = self.reg[rs] | imm4
-        self.flag_c = False
-        self.flag_z = result == 0
-        self.write_reg(rd, result)
-
-    def exec_slti(self, instr):
-        _, rd, rs, imm4 = decode_i_type(instr)
-        rs_val = self.reg[rs]
+        s[FLAG_Z] = result == 0
+        s[_WRITE_SLOT[rd]] = result
+
+    def exec_andi(self, rd, rs, imm4):
+        s = self.state
+        result = s[rs] & imm4
+        s[FLAG_C] = 0
+        s[FLAG_Z] = result == 0
+        s[_WRITE_SLOT[rd]] = result
+
+    def exec_ori(self, rd, rs, imm4):
+        s = self.state
+        result = s[rs] | imm4
+        s[FLAG_C] = 0
+        s[FLAG_Z] = result == 0
+        s[_WRITE_SLOT[rd]] = result
+
+    def exec_slti(self, rd, rs, imm4):
+        s = self.state
+        rs_val = s[rs]
         rs_signed = rs_val if rs_val < 8 else rs_val - 16
         imm_signed = sign_extend_4bit(imm4)
         result = 1 if rs_signed < imm_signed else 0
-        self.flag_c = False
-        self.flag_z = result == 0
-        self.write_reg(rd, result)
-
-    def exec_lw(self, instr):
-        _, rd, base, offset4 = decode_m_type(instr)
-        offset_signed = sign_extend_4bit(offset4)
-        addr = (self.get_pair_value(base) + offset_signed) & 0xFF
-        value = self.memory[addr] & 0xF
-        self.write_reg(rd, value)
-
-    def exec_sw(self, instr):
-        _, rs, base, offset4 = decode_m_type(instr)
-        offset_signed = sign_extend_4bit(offset4)
-        addr = (self.get_pair_value(base) + offset_signed) & 0xFF
-        self.memory[addr] = self.reg[rs] & 0xF
-
-    def exec_branch(self, instr):
-        _, cond, offset8 = decode_branch_type(instr)
-        offset_signed = sign_extend_8bit(offset8)
-
-        taken = False
-        if cond == 0x0:  # BEQ
-            taken = self.flag_z
-        elif cond == 0x1:  # BNE
-            taken = not self.flag_z
-        elif cond == 0x2:  # BCS
-            taken = self.flag_c
-        elif cond == 0x3:  # BCC
-            taken = not self.flag_c
-
-        if taken:
-            self.pc = (self.pc + offset_signed * 4) & 0xFFF
-
-    def exec_jump(self, instr):
-        _, target12 = decode_j_type(instr)
-        is_jal = (instr >> 11) & 1
+        s[FLAG_C] = 0
+        s[FLAG_Z] = result == 0
+        s[_WRITE_SLOT[rd]] = result
+
+    def exec_lw(self, rd, base, offset4):
+        s = self.state
+        if base == 15:
+            raise IndexError("r15 has no low half to pair with")
+        offset_signed = (offset4 ^ 0x8) - 0x8
+        addr = (((s[base] << 4) | s[base + 1]) + offset_signed) & 0xFF
+        s[_WRITE_SLOT[rd]] = self.memory[addr] & 0xF
+
+    def exec_sw(self, rs, base, offset4):
+        s = self.state
+        if base == 15:
+            raise IndexError("r15 has no low half to pair with")
+        offset_signed = (offset4 ^ 0x8) - 0x8
+        addr = (((s[base] << 4) | s[base + 1]) + offset_signed) & 0xFF
+        self.memory[addr] = s[rs] & 0xF
+
+    def exec_branch(self, cond, offset_hi, offset_lo):
+        s = self.state
+        fz = s[FLAG_Z]
+        fc = s[FLAG_C]
+        # Bit n is set when condition n holds: BEQ, BNE, BCS, BCC.
+        # Conditions 4-15 shift past the mask and are never taken.
+        taken = ((((fc ^ 1) << 3) | (fc << 2) | ((fz ^ 1) << 1) | fz) >> cond) & 1
+
+        # Select between fall-through and target arithmetically
+        pc = s[PC]
+        offset_signed = (((offset_hi << 4) | offset_lo) ^ 0x80) - 0x80
+        s[PC] = pc + taken * (((pc + offset_signed * 4) & 0xFFF) - pc)
+
+    def exec_jump(self, a, b, c):
+        s = self.state
+        target12 = (a << 8) | (b << 4) | c
+        is_jal = a >> 3
 
         if is_jal:  # JAL
             # Save return address as instruction index
-            ret_addr = self.pc // 4
-            self.reg[1] = (ret_addr >> 8) & 0xF
-            self.reg[2] = (ret_addr >> 4) & 0xF
-            self.reg[3] = ret_addr & 0xF
+            ret_addr = s[PC] // 4
+            s[1] = (ret_addr >> 8) & 0xF
+            s[2] = (ret_addr >> 4) & 0xF
+            s[3] = ret_addr & 0xF
 
             # Jump to 11-bit target (convert to nibble address)
             target = target12 & 0x7FF
-            self.pc = target * 4  # ← FIX!
+            s[PC] = target * 4  # ← FIX!
         else:  # J
             # Jump to 12-bit target (convert to nibble address)
-            self.pc = target12 * 4  # ← FIX!
+            s[PC] = target12 * 4  # ← FIX!
 
     def trace_state(self, cycle):
         sp = (self.reg[14] << 4) | self.reg[15]
@@ -303,24 +387,3 @@ class RISC4:
             f"r6={self.reg[6]:X} r7={self.reg[7]:X} r10={self.reg[10]:X} r11={self.reg[11]:X} "
             f"SP=0x{sp:02X}"
         )
-
-
-"""
-    def exec_jump(self, instr):
-        _, target12 = decode_j_type(instr)
-        is_jal = (instr >> 11) & 1
-
-        if is_jal:  # JAL
-            # Save return address (PC+4 in nibbles, convert to instruction number)
-            ret_addr = self.pc // 4
-            self.reg[1] = (ret_addr >> 8) & 0xF
-            self.reg[2] = (ret_addr >> 4) & 0xF
-            self.reg[3] = ret_addr & 0xF
-
-            # Jump to 11-bit target (already in nibble units, don't multiply by 4!)
-            target = target12 & 0x7FF  # Mask to 11 bits
-            self.pc = target  # ← FIX: Don't multiply by 4!
-        else:  # J
-            # Jump to 12-bit target (already in nibble units)
-            self.pc = target12  # ← FIX: Don't multiply by 4!
-"""
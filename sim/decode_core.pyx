@@ -0,0 +1,246 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+Cython build of the RISC-4 ISS core.
+
+Build in place (needs Cython and a C compiler):
+    cythonize -3 -i sim/decode_core.pyx
+
+State uses the same slot layout as decode.RISC4.state, and RISC4 here
+has the same reset/attach_rom/fetch/decode_and_execute methods and
+pc/flag properties, so step-by-step test code drives either one. It
+does not have the Python core's decode cache (decoded, predecode,
+dispatch); it adds a compiled run() loop instead, which bubble.run
+uses for untraced runs. sim/bench.py compares the two.
+"""
+
+from array import array
+
+cimport cython
+
+
+cdef enum:
+    PC = 16
+    FLAG_C = 17
+    FLAG_Z = 18
+    ZERO_SINK = 19  # r0 is hardwired to zero: its writes land here instead
+    STATE_SIZE = 20
+
+# Packed (carry << 4) | result, indexed by (imm4 << 4) | rs
+cdef unsigned char SHF_TABLE[256]
+
+
+cdef void _build_shf_table():
+    cdef int imm4, rs_val, shift_amt, result, carry
+    for imm4 in range(16):
+        shift_amt = imm4 & 0x7
+        for rs_val in range(16):
+            if imm4 & 0x8:  # Right shift: C = last bit shifted out of bit 0
+                result = rs_val >> shift_amt
+                carry = ((rs_val << 1) >> shift_amt) & 1
+            else:  # Left shift: C = last bit shifted out of bit 3
+                result = rs_val << shift_amt
+                carry = (result >> 4) & 1
+                result &= 0xF
+            SHF_TABLE[(imm4 << 4) | rs_val] = (carry << 4) | result
+
+
+_build_shf_table()
+
+
+@cython.final
+cdef class RISC4:
+    cdef readonly object state
+    cdef readonly object reg
+    cdef readonly bytearray memory
+    cdef unsigned short[::1] s
+    cdef unsigned char[::1] m
+    cdef const unsigned char[::1] r
+    cdef readonly object rom
+    cdef readonly Py_ssize_t rom_base, rom_end
+
+    def __init__(self, mem_size=4096):
+        # Registers, PC and flags share one contiguous uint16 buffer
+        self.state = array("H", bytes(2 * STATE_SIZE))
+        self.reg = memoryview(self.state)[:16]
+        self.memory = bytearray(mem_size)
+        self.s = self.state
+        self.m = self.memory
+        self.attach_rom(b"")
+
+    @property
+    def pc(self):
+        return self.s[PC]
+
+    @pc.setter
+    def pc(self, value):
+        self.s[PC] = value
+
+    @property
+    def flag_c(self):
+        return self.s[FLAG_C]
+
+    @flag_c.setter
+    def flag_c(self, value):
+        self.s[FLAG_C] = value
+
+    @property
+    def flag_z(self):
+        return self.s[FLAG_Z]
+
+    @flag_z.setter
+    def flag_z(self, value):
+        self.s[FLAG_Z] = value
+
+    def reset(self):
+        """Zero registers, PC, flags and memory in place"""
+        self.state[:] = array("H", bytes(2 * STATE_SIZE))
+        self.memory[:] = bytes(len(self.memory))
+        self.attach_rom(b"")
+
+    def attach_rom(self, image, Py_ssize_t base=0):
+        """Fetch instructions straight from a packed program image"""
+        self.rom = memoryview(image)
+        self.r = self.rom
+        self.rom_base = base
+        self.rom_end = base + self.r.shape[0]
+
+    cpdef unsigned short fetch(self):
+        cdef Py_ssize_t byte_addr = self.s[PC] >> 1
+        if self.rom_base <= byte_addr < self.rom_end - 1:
+            byte_addr -= self.rom_base
+            self.s[PC] += 4
+            return (self.r[byte_addr] << 8) | self.r[byte_addr + 1]
+        if byte_addr + 1 >= self.m.shape[0]:
+            raise IndexError("fetch outside memory")
+        self.s[PC] += 4  # Move forward 1 instruction (4 nibbles)
+        return (self.m[byte_addr] << 8) | self.m[byte_addr + 1]
+
+    cpdef decode_and_execute(self, unsigned short instr):
+        self._execute(instr)
+
+    cpdef int run(self, int max_cycles, int halt_pc=-1) except -1:
+        """Run up to max_cycles instructions, stopping early at halt_pc.
+
+        Returns the number of cycles executed.
+        """
+        cdef int cycle = 0
+        while cycle < max_cycles:
+            if self.s[PC] == halt_pc and cycle > 0:
+                break
+            self._execute(self.fetch())
+            cycle += 1
+        return cycle
+
+    cdef inline int _execute(self, unsigned int instr) except -1:
+        cdef unsigned short[::1] s = self.s
+        cdef unsigned int op = (instr >> 12) & 0xF
+        cdef unsigned int a = (instr >> 8) & 0xF
+        cdef unsigned int b = (instr >> 4) & 0xF
+        cdef unsigned int c = instr & 0xF
+        cdef int result, carry, offset, addr, rs_signed, rt_signed
+        cdef unsigned int target, fz, fc, taken
+        cdef int pc
+
+        carry = s[FLAG_C]
+
+        if op == 0x0:  # ADD
+            result = s[b] + s[c]
+            carry = (result >> 4) & 1
+        elif op == 0x1:  # SUB
+            result = <int>s[b] - <int>s[c]
+            carry = (result >> 4) & 1  # Borrow: negative results shift in 1s
+        elif op == 0x2:  # AND
+            result = s[b] & s[c]
+            carry = 0
+        elif op == 0x3:  # OR
+            result = s[b] | s[c]
+            carry = 0
+        elif op == 0x4:  # XOR
+            result = s[b] ^ s[c]
+            carry = 0
+        elif op == 0x5:  # SLT
+            rs_signed = (<int>s[b] ^ 0x8) - 0x8
+            rt_signed = (<int>s[c] ^ 0x8) - 0x8
+            result = rs_signed < rt_signed
+            carry = 0
+        elif op == 0x6:  # SHF
+            result = SHF_TABLE[(c << 4) | s[b]]
+            carry = result >> 4
+        elif op == 0x7:  # EXT
+            if c == 0x0:  # ADC
+                result = s[a] + s[b] + carry
+                carry = (result >> 4) & 1
+            elif c == 0x1:  # SBB
+                result = <int>s[a] - <int>s[b] - carry
+                carry = (result >> 4) & 1
+            elif c == 0x2:  # NEG
+                result = -<int>s[b]
+                carry = s[b] != 0
+            elif c == 0x3:  # JR
+                target = (s[1] << 8) | (s[2] << 4) | s[3]
+                s[PC] = (target & 0xFFF) * 4  # Convert to nibble address
+                return 0
+            else:
+                raise ValueError(f"Unknown EXT function: {c:X}")
+        elif op == 0x8:  # ADDI
+            result = s[b] + ((<int>c ^ 0x8) - 0x8)
+            carry = (result >> 4) & 1
+        elif op == 0x9:  # ANDI
+            result = s[b] & c
+            carry = 0
+        elif op == 0xA:  # ORI
+            result = s[b] | c
+            carry = 0
+        elif op == 0xB:  # SLTI
+            rs_signed = (<int>s[b] ^ 0x8) - 0x8
+            result = rs_signed < (<int>c ^ 0x8) - 0x8
+            carry = 0
+        elif op == 0xC:  # LW
+            if b == 15:
+                raise IndexError("r15 has no low half to pair with")
+            offset = (<int>c ^ 0x8) - 0x8
+            addr = (((s[b] << 4) | s[b + 1]) + offset) & 0xFF
+            s[a if a else ZERO_SINK] = self.m[addr] & 0xF
+            return 0
+        elif op == 0xD:  # SW
+            if b == 15:
+                raise IndexError("r15 has no low half to pair with")
+            offset = (<int>c ^ 0x8) - 0x8
+            addr = (((s[b] << 4) | s[b + 1]) + offset) & 0xFF
+            self.m[addr] = s[a] & 0xF
+            return 0
+        elif op == 0xE:  # BRANCH
+            fz = s[FLAG_Z]
+            fc = s[FLAG_C]
+            # Bit n is set when condition n holds: BEQ, BNE, BCS, BCC
+            taken = ((((fc ^ 1) << 3) | (fc << 2) | ((fz ^ 1) << 1) | fz) >> a) & 1
+            pc = s[PC]
+            offset = (<int>(instr & 0xFF) ^ 0x80) - 0x80
+            s[PC] = pc + <int>taken * (((pc + offset * 4) & 0xFFF) - pc)
+            return 0
+        else:  # JUMP
+            target = instr & 0xFFF
+            if (instr >> 11) & 1:  # JAL
+                # Save return address as instruction index
+                addr = s[PC] // 4
+                s[1] = (addr >> 8) & 0xF
+                s[2] = (addr >> 4) & 0xF
+                s[3] = addr & 0xF
+                s[PC] = (target & 0x7FF) * 4
+            else:  # J
+                s[PC] = target * 4
+            return 0
+
+        result &= 0xF
+        s[FLAG_C] = carry
+        s[FLAG_Z] = result == 0
+        s[a if a else ZERO_SINK] = result
+        return 0
+
+    def trace_state(self, cycle):
+        sp = (self.reg[14] << 4) | self.reg[15]
+        print(
+            f"[{cycle:4d}] PC=0x{self.pc:03X} "
+            f"r6={self.reg[6]:X} r7={self.reg[7]:X} r10={self.reg[10]:X} r11={self.reg[11]:X} "
+            f"SP=0x{sp:02X}"
+        )
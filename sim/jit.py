@@ -0,0 +1,192 @@
+"""
+Numba-compiled interpreter core for the RISC-4 ISS.
+
+The CPU state is a (state, mem) tuple of NumPy arrays laid out exactly
+like decode.RISC4:
+    state: uint16[20]  r0-r15, then PC (nibble address), C, Z, r0 sink
+    mem:   uint8[N]    memory (one nibble per byte)
+
+Numba is optional; without it the kernels run as plain Python over the
+same arrays (slow, but bit-identical to the compiled path).
+"""
+
+import numpy as np
+
+from decode import FLAG_C, FLAG_Z, PC
+
+try:
+    from numba import njit
+except ImportError:  # pragma: no cover - numba is an optional speedup
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+def make_state(cpu):
+    """View a decode.RISC4 as a (state, mem) tuple without copying.
+
+    The arrays alias cpu.state and cpu.memory, so kernel writes land in
+    the cpu directly.
+    """
+    state = np.frombuffer(cpu.state, dtype=np.uint16)
+    mem = np.frombuffer(cpu.memory, dtype=np.uint8)
+    return state, mem
+
+
+def sim_run(cpu, max_cycles, halt_pc=-1):
+    """Run a decode.RISC4 for up to max_cycles through run_njit.
+
+    Runs in place on the cpu's own buffers. The kernels fetch from memory
+    only, so a cpu with a program image attached is rejected. Returns the
+    cycle count.
+    """
+    if cpu.rom_end:
+        raise ValueError("sim_run cannot fetch from an attached ROM; load the program")
+    return run_njit(make_state(cpu), max_cycles, halt_pc)
+
+
+@njit(cache=True)
+def fetch_njit(state):
+    s, mem = state
+    pc = np.int64(s[PC])
+    byte_addr = pc >> 1
+    if byte_addr + 1 >= mem.shape[0]:
+        raise IndexError("fetch outside memory")
+    instr = (np.int64(mem[byte_addr]) << 8) | np.int64(mem[byte_addr + 1])
+    s[PC] = pc + 4  # Move forward 1 instruction (4 nibbles)
+    return instr
+
+
+@njit(cache=True)
+def step_njit(state, instr):
+    s, mem = state
+    op = (instr >> 12) & 0xF
+    a = (instr >> 8) & 0xF
+    b = (instr >> 4) & 0xF
+    c = instr & 0xF
+
+    carry = np.int64(s[FLAG_C])
+    result = 0
+
+    if op == 0x0:  # ADD
+        result = np.int64(s[b]) + np.int64(s[c])
+        carry = (result >> 4) & 1
+    elif op == 0x1:  # SUB
+        result = np.int64(s[b]) - np.int64(s[c])
+        carry = (result >> 4) & 1
+    elif op == 0x2:  # AND
+        result = np.int64(s[b]) & np.int64(s[c])
+        carry = 0
+    elif op == 0x3:  # OR
+        result = np.int64(s[b]) | np.int64(s[c])
+        carry = 0
+    elif op == 0x4:  # XOR
+        result = np.int64(s[b]) ^ np.int64(s[c])
+        carry = 0
+    elif op == 0x5:  # SLT
+        rs_val = np.int64(s[b])
+        rt_val = np.int64(s[c])
+        rs_signed = rs_val if rs_val < 8 else rs_val - 16
+        rt_signed = rt_val if rt_val < 8 else rt_val - 16
+        result = 1 if rs_signed < rt_signed else 0
+        carry = 0
+    elif op == 0x6:  # SHF
+        rs_val = np.int64(s[b])
+        shift_amt = c & 0x7
+        if c & 0x8:  # Right shift
+            result = rs_val >> shift_amt
+            carry = ((rs_val << 1) >> shift_amt) & 1
+        else:  # Left shift
+            result = rs_val << shift_amt
+            carry = (result >> 4) & 1
+    elif op == 0x7:  # EXT
+        if c == 0x0:  # ADC
+            result = np.int64(s[a]) + np.int64(s[b]) + carry
+            carry = (result >> 4) & 1
+        elif c == 0x1:  # SBB
+            result = np.int64(s[a]) - np.int64(s[b]) - carry
+            carry = (result >> 4) & 1
+        elif c == 0x2:  # NEG
+            result = 0 - np.int64(s[b])
+            carry = 1 if s[b] != 0 else 0
+        elif c == 0x3:  # JR
+            target = (np.int64(s[1]) << 8) | (np.int64(s[2]) << 4) | np.int64(s[3])
+            s[PC] = (target & 0xFFF) * 4
+            return
+        else:
+            raise ValueError("Unknown EXT function")
+    elif op == 0x8:  # ADDI
+        imm_signed = (c ^ 0x8) - 0x8
+        result = np.int64(s[b]) + imm_signed
+        carry = (result >> 4) & 1
+    elif op == 0x9:  # ANDI
+        result = np.int64(s[b]) & c
+        carry = 0
+    elif op == 0xA:  # ORI
+        result = np.int64(s[b]) | c
+        carry = 0
+    elif op == 0xB:  # SLTI
+        rs_val = np.int64(s[b])
+        rs_signed = rs_val if rs_val < 8 else rs_val - 16
+        imm_signed = (c ^ 0x8) - 0x8
+        result = 1 if rs_signed < imm_signed else 0
+        carry = 0
+    elif op == 0xC:  # LW
+        if b == 15:
+            raise IndexError("r15 has no low half to pair with")
+        offset_signed = (c ^ 0x8) - 0x8
+        addr = (((np.int64(s[b]) << 4) | np.int64(s[b + 1])) + offset_signed) & 0xFF
+        if a != 0:
+            s[a] = mem[addr] & 0xF
+        return
+    elif op == 0xD:  # SW
+        if b == 15:
+            raise IndexError("r15 has no low half to pair with")
+        offset_signed = (c ^ 0x8) - 0x8
+        addr = (((np.int64(s[b]) << 4) | np.int64(s[b + 1])) + offset_signed) & 0xFF
+        mem[addr] = s[a] & 0xF
+        return
+    elif op == 0xE:  # BRANCH
+        fz = np.int64(s[FLAG_Z])
+        fc = np.int64(s[FLAG_C])
+        # Bit n is set when condition n holds: BEQ, BNE, BCS, BCC
+        taken = ((((fc ^ 1) << 3) | (fc << 2) | ((fz ^ 1) << 1) | fz) >> a) & 1
+        pc = np.int64(s[PC])
+        offset_signed = ((instr & 0xFF) ^ 0x80) - 0x80
+        s[PC] = pc + taken * (((pc + offset_signed * 4) & 0xFFF) - pc)
+        return
+    else:  # JUMP
+        target12 = instr & 0xFFF
+        if (instr >> 11) & 1:  # JAL
+            ret_addr = np.int64(s[PC]) // 4
+            s[1] = (ret_addr >> 8) & 0xF
+            s[2] = (ret_addr >> 4) & 0xF
+            s[3] = ret_addr & 0xF
+            s[PC] = (target12 & 0x7FF) * 4
+        else:  # J
+            s[PC] = target12 * 4
+        return
+
+    result &= 0xF
+    s[FLAG_C] = carry
+    s[FLAG_Z] = 1 if result == 0 else 0
+    if a != 0:
+        s[a] = result
+
+
+@njit(cache=True)
+def run_njit(state, max_cycles, halt_pc=-1):
+    """Run up to max_cycles instructions, stopping early at halt_pc.
+
+    Returns the number of cycles executed.
+    """
+    s = state[0]
+    cycle = 0
+    while cycle < max_cycles:
+        if s[PC] == halt_pc and cycle > 0:
+            break
+        step_njit(state, fetch_njit(state))
+        cycle += 1
+    return cycle
@@ -1,5 +1,40 @@
+import contextlib
+import io
+import struct
+import sys
+
 import decode
 
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - only the *_vec assemblers need it
+    np = None
+
+try:
+    from jit import sim_run
+except ImportError:  # pragma: no cover - NumPy missing: step the Python core
+
+    def sim_run(cpu, max_cycles, halt_pc=-1):
+        if cpu.rom_end:
+            raise ValueError(
+                "sim_run cannot fetch from an attached ROM; load the program"
+            )
+        for cycle in range(max_cycles):
+            if cpu.pc == halt_pc and cycle > 0:
+                return cycle
+            cpu.decode_and_execute(cpu.fetch())
+        return max_cycles
+
+
+# Test programs run straight-line until PC falls off their last
+# instruction; there is no spare opcode for a HALT. Generous upper bound
+# on steps for each run.
+MAX_CYCLES = 1000
+
+# Per-instruction trace output. Records are collected while the test
+# runs and formatted once afterwards, so tracing stays out of the loop.
+TRACE = False
+
 # Add these helper functions to your test file
 
 
@@ -7,14 +42,14 @@ def assemble_i_type(opcode, rd, rs, imm4):
     """Assemble I-type instruction
     Format: [opcode:4][rd:4][rs:4][imm4:4]
     """
-    return (opcode << 12) | (rd << 8) | (rs << 4) | (imm4 & 0xF)
+    return decode.pack_fields(opcode, rd, rs, imm4)
 
 
 def assemble_r_type(opcode, rd, rs, rt):
     """Assemble R-type instruction
     Format: [opcode:4][rd:4][rs:4][rt:4]
     """
-    return (opcode << 12) | (rd << 8) | (rs << 4) | (rt & 0xF)
+    return decode.pack_fields(opcode, rd, rs, rt)
 
 
 def assemble_j_type(opcode, target12):
@@ -28,14 +63,14 @@ def assemble_m_type(opcode, rd, base, offset4):
     """Assemble M-type instruction (LW/SW)
     Format: [opcode:4][rd:4][base:4][offset:4]
     """
-    return (opcode << 12) | (rd << 8) | (base << 4) | (offset4 & 0xF)
+    return decode.pack_fields(opcode, rd, base, offset4)
 
 
 def assemble_ext(rd, rs, funct):
     """Assemble EXT instruction (ADC, SBB, NEG, JR)
     Format: [0x7:4][rd:4][rs:4][funct:4]
     """
-    return (0x7 << 12) | (rd << 8) | (rs << 4) | (funct & 0xF)
+    return decode.pack_fields(0x7, rd, rs, funct)
 
 
 def assemble_branch(cond, offset8):
@@ -46,19 +81,82 @@ def assemble_branch(cond, offset8):
     return (0xE << 12) | (cond << 8) | (offset8 & 0xFF)
 
 
+# Batch assemblers: same encodings as above, but each field may be an
+# array so a whole program is built in one pass. Return uint16 arrays.
+def _pack_nibbles_vec(opcode, a, b, c):
+    """Pack four nibble arrays into instruction words, like decode.pack_fields"""
+    fields = [np.asarray(f, dtype=np.int64) for f in (opcode, a, b, c)]
+    opcode, a, b, c = fields
+    return (
+        ((opcode & 0xF) << 12) | ((a & 0xF) << 8) | ((b & 0xF) << 4) | (c & 0xF)
+    ).astype(np.uint16)
+
+
+def assemble_i_type_vec(opcode, rd, rs, imm4):
+    """Batch assemble_i_type"""
+    return _pack_nibbles_vec(opcode, rd, rs, imm4)
+
+
+def assemble_r_type_vec(opcode, rd, rs, rt):
+    """Batch assemble_r_type"""
+    return _pack_nibbles_vec(opcode, rd, rs, rt)
+
+
+def assemble_m_type_vec(opcode, rd, base, offset4):
+    """Batch assemble_m_type"""
+    return _pack_nibbles_vec(opcode, rd, base, offset4)
+
+
+def assemble_ext_vec(rd, rs, funct):
+    """Batch assemble_ext"""
+    return _pack_nibbles_vec(0x7, rd, rs, funct)
+
+
+def assemble_j_type_vec(opcode, target12):
+    """Batch assemble_j_type"""
+    opcode = np.asarray(opcode, dtype=np.int64)
+    target12 = np.asarray(target12, dtype=np.int64)
+    return ((opcode << 12) | (target12 & 0xFFF)).astype(np.uint16)
+
+
+def assemble_branch_vec(cond, offset8):
+    """Batch assemble_branch"""
+    cond = np.asarray(cond, dtype=np.int64)
+    offset8 = np.asarray(offset8, dtype=np.int64)
+    return ((0xE << 12) | (cond << 8) | (offset8 & 0xFF)).astype(np.uint16)
+
+
+def pack_program(program):
+    """Pack a list of instructions into a big-endian memory image"""
+    return struct.pack(f">{len(program)}H", *(instr & 0xFFFF for instr in program))
+
+
 def load_program(cpu, program):
-    """Load list of instructions into memory starting at address 0"""
-    for i, instr in enumerate(program):
-        byte_addr = i * 2
-        cpu.memory[byte_addr] = (instr >> 8) & 0xFF
-        cpu.memory[byte_addr + 1] = instr & 0xFF
+    """Load a list, uint16 array or packed big-endian image at address 0"""
+    if isinstance(program, (bytes, bytearray, memoryview)):
+        image = program
+    elif np is not None and isinstance(program, np.ndarray):
+        image = program.astype(">u2").tobytes()
+    else:
+        image = pack_program(program)
+    cpu.memory[: len(image)] = image
+
 
+def reg_concat(cpu, regs):
+    """Read registers as one multi-nibble value, first register most significant"""
+    value = 0
+    for r in regs:
+        value = (value << 4) | cpu.reg[r]
+    return value
 
-def test_multiprecision_add():
-    """Test 8-bit addition: r6:r1 = r2:r3 + r4:r5"""
-    cpu = decode.RISC4()
 
-    program = [
+# Shared by every test; each one resets it instead of allocating anew
+_CPU = decode.RISC4()
+
+
+# Test programs are assembled and packed once, at import
+_PROG_MULTIADD = pack_program(
+    [
         assemble_i_type(0xA, 2, 0, 0x9),  # ORI r2, r0, 0x9
         assemble_i_type(0xA, 3, 0, 0xF),  # ORI r3, r0, 0xF
         assemble_i_type(0xA, 4, 0, 0x2),  # ORI r4, r0, 0x2
@@ -67,33 +165,10 @@ def test_multiprecision_add():
         assemble_r_type(0x0, 1, 3, 5),  # ADD r1, r3, r5
         assemble_ext(6, 4, 0),  # ADC r6, r4
     ]
+)
 
-    load_program(cpu, program)
-
-    # Execute with debug
-    for i in range(len(program)):
-        instr = cpu.fetch()
-        print(f"[{i}] 0x{instr:04X} ", end="")
-        cpu.decode_and_execute(instr)
-        print(
-            f"→ r1={cpu.reg[1]:X} r2={cpu.reg[2]:X} r3={cpu.reg[3]:X} r4={cpu.reg[4]:X} r5={cpu.reg[5]:X} r6={cpu.reg[6]:X} C={cpu.flag_c}"
-        )
-
-    result = (cpu.reg[6] << 4) | cpu.reg[1]
-    print(f"\nr2:r3 = 0x9F = 159 decimal")
-    print(f"r4:r5 = 0x23 = 35 decimal")
-    print(f"r6:r1 = 0x{cpu.reg[6]:X}{cpu.reg[1]:X} = {result} decimal")
-    print(f"Expected: 0xC2 = 194 decimal")
-
-    assert cpu.reg[6] == 0xC and cpu.reg[1] == 0x2
-    print("PASS ADD")
-
-
-def test_branch():
-    """Test BEQ/BNE"""
-    cpu = decode.RISC4()
-
-    program = [
+_PROG_BRANCH = pack_program(
+    [
         assemble_i_type(0xA, 1, 0, 0x5),  # ORI r1, r0, 0x5
         assemble_i_type(0xA, 2, 0, 0x5),  # ORI r2, r0, 0x5
         assemble_r_type(0x1, 3, 1, 2),  # SUB r3, r1, r2 (sets Z=1)
@@ -102,29 +177,10 @@ def test_branch():
         assemble_i_type(0xA, 5, 0, 0xF),  # ORI r5, r0, 0xF (should be skipped)
         assemble_i_type(0xA, 6, 0, 0x7),  # ORI r6, r0, 0x7 (should execute)
     ]
+)
 
-    load_program(cpu, program)
-
-    for i in range(7):
-        instr = cpu.fetch()
-        print(f"[{i}] PC={cpu.pc - 4:02X} 0x{instr:04X}")
-        cpu.decode_and_execute(instr)
-
-    print(f"\nr4 = {cpu.reg[4]:X} (expected 0 - should be skipped)")
-    print(f"r5 = {cpu.reg[5]:X} (expected 0 - should be skipped)")
-    print(f"r6 = {cpu.reg[6]:X} (expected 7 - should execute)")
-
-    assert cpu.reg[4] == 0
-    assert cpu.reg[5] == 0
-    assert cpu.reg[6] == 7
-    print("PASS branch")
-
-
-def test_load_store():
-    """Test LW/SW with register pairs"""
-    cpu = decode.RISC4()
-
-    program = [
+_PROG_LOAD_STORE = pack_program(
+    [
         # Set up base pointer r14:r15 = 0x80
         assemble_i_type(0xA, 14, 0, 0x8),  # ORI r14, r0, 0x8
         assemble_i_type(0xA, 15, 0, 0x0),  # ORI r15, r0, 0x0
@@ -135,90 +191,262 @@ def test_load_store():
         assemble_i_type(0xA, 2, 0, 0x0),  # ORI r2, r0, 0x0 (clear r2)
         assemble_m_type(0xC, 2, 14, 0),  # LW r2, 0(r14) → r2 = mem[0x80]
     ]
+)
 
-    load_program(cpu, program)
-
-    for i in range(len(program)):
-        instr = cpu.fetch()
-        cpu.decode_and_execute(instr)
-
-    print(f"r1 = {cpu.reg[1]:X} (value stored)")
-    print(f"r2 = {cpu.reg[2]:X} (value loaded)")
-    print(f"mem[0x80] = {cpu.memory[0x80]:X}")
-
-    assert cpu.reg[2] == 0xA
-    assert cpu.memory[0x80] == 0xA
-    print("PASS load store")
-
-
-def test_jal_jr():
-    """Test JAL and JR"""
-    cpu = decode.RISC4()
-
-    program = [
+_PROG_JAL_JR = pack_program(
+    [
         # Main - nibble addresses 0x00, 0x04, 0x08, 0x0C
         assemble_i_type(0xA, 4, 0, 0x3),  # 0x00: ORI r4, r0, 0x3
-        assemble_j_type(
-            0xF, 0x010 | 0x800
-        ),  # 0x04: JAL 0x010 ← FIX: jump to 0x10, not 0x08
+        assemble_j_type(0xF, 0x004 | 0x800),  # 0x04: JAL 4 (instruction index)
         assemble_i_type(0xA, 5, 0, 0x9),  # 0x08: ORI r5, r0, 0x9 (return here)
-        assemble_j_type(0xF, 0x000),  # 0x0C: J 0x000 (loop)
+        assemble_j_type(0xF, 0x006),  # 0x0C: J 6 (past the end: done)
         # Function - nibble addresses 0x10, 0x14
-        assemble_i_type(0x8, 4, 4, 0x1),  # 0x10: ADDI r4, r4, 1 ← Function starts here
-        assemble_ext(0, 0, 3),  # 0x14: JR (return)
-    ]
-
-    load_program(cpu, program)
-    print("Memory contents (first 12 bytes):")
-    for i in range(12):
-        print(f"  Byte {i:02X}: 0x{cpu.memory[i]:02X}")
-    print()
-
-    print("Expected:")
-    print("  Byte 00: 0xA4  Byte 01: 0x03  <- 0xA403")
-    print("  Byte 02: 0xF8  Byte 03: 0x10  <- 0xF810")
-    print("  Byte 04: 0xA5  Byte 05: 0x09  <- 0xA509")
-    print()
-
-    print("Program loaded:")
-    for i in range(len(program)):
-        print(f"  Nibble {i * 4:03X} (Byte {i * 2:03X}): 0x{program[i]:04X}")
-
-    # Execute with detailed trace
-    for i in range(20):
-        pc_before = cpu.pc
-        instr = cpu.fetch()
-        print(f"\n[{i}] PC={pc_before:03X} Fetch=0x{instr:04X}", end="")
-
-        # Decode to show what instruction this is
-        opcode = (instr >> 12) & 0xF
-        if opcode == 0xF:
-            bit11 = (instr >> 11) & 0x1
-            if bit11:
-                print(" (JAL)", end="")
-            else:
-                print(" (J)", end="")
-        elif opcode == 0x7:
-            funct = instr & 0xF
-            if funct == 3:
-                print(" (JR)", end="")
-
-        cpu.decode_and_execute(instr)
-        print(
-            f" → PC={cpu.pc:03X} r1={cpu.reg[1]:X} r2={cpu.reg[2]:X} r3={cpu.reg[3]:X} r4={cpu.reg[4]:X} r5={cpu.reg[5]:X}"
-        )
-
-        if cpu.pc == 0x00 and i > 0:  # Looped back to start
-            print("Detected loop back to PC=0")
-            break
-
-    print(f"\nFinal state:")
-    print(f"r1:r2:r3 = {cpu.reg[1]:X}:{cpu.reg[2]:X}:{cpu.reg[3]:X} (return address)")
-    print(f"r4 = {cpu.reg[4]:X} (expected 4)")
-    print(f"r5 = {cpu.reg[5]:X} (expected 9)")
-    print("PASS jal")
-
-
-test_multiprecision_add()
-test_jal_jr()
-test_branch()
+        assemble_i_type(0x8, 4, 4, 0x1),  # 0x10: ADDI r4, r4, 1
+        assemble_ext(0, 0, 3),  # 0x14: JR (return to r1:r2:r3)
+    ]
+)
+
+# One taken branch per condition; each skips the ORI in its shadow
+_PROG_BNE_TAKEN = pack_program(
+    [
+        assemble_i_type(0xA, 1, 0, 0x1),  # ORI r1, r0, 0x1 (Z=0)
+        assemble_branch(0x1, 0x01),  # BNE +1
+        assemble_i_type(0xA, 4, 0, 0xF),  # ORI r4, r0, 0xF (skipped)
+        assemble_i_type(0xA, 6, 0, 0x7),  # ORI r6, r0, 0x7
+    ]
+)
+
+_PROG_BCS_TAKEN = pack_program(
+    [
+        assemble_i_type(0xA, 1, 0, 0xF),  # ORI r1, r0, 0xF
+        assemble_i_type(0x8, 1, 1, 0x1),  # ADDI r1, r1, 1 (C=1)
+        assemble_branch(0x2, 0x01),  # BCS +1
+        assemble_i_type(0xA, 4, 0, 0xF),  # ORI r4, r0, 0xF (skipped)
+        assemble_i_type(0xA, 6, 0, 0x7),  # ORI r6, r0, 0x7
+    ]
+)
+
+_PROG_BCC_TAKEN = pack_program(
+    [
+        assemble_i_type(0xA, 1, 0, 0x1),  # ORI r1, r0, 0x1
+        assemble_i_type(0x8, 1, 1, 0x1),  # ADDI r1, r1, 1 (C=0)
+        assemble_branch(0x3, 0x01),  # BCC +1
+        assemble_i_type(0xA, 4, 0, 0xF),  # ORI r4, r0, 0xF (skipped)
+        assemble_i_type(0xA, 6, 0, 0x7),  # ORI r6, r0, 0x7
+    ]
+)
+
+# Every condition once more with its flag the other way: nothing is skipped
+_PROG_BRANCH_NOT_TAKEN = pack_program(
+    [
+        assemble_i_type(0xA, 1, 0, 0x0),  # ORI r1, r0, 0x0 (Z=1, C=0)
+        assemble_branch(0x1, 0x01),  # BNE +1 (not taken)
+        assemble_i_type(0xA, 4, 0, 0xA),  # ORI r4, r0, 0xA (Z=0, C=0)
+        assemble_branch(0x2, 0x01),  # BCS +1 (not taken)
+        assemble_i_type(0xA, 5, 0, 0xB),  # ORI r5, r0, 0xB
+        assemble_branch(0x0, 0x01),  # BEQ +1 (not taken)
+        assemble_i_type(0xA, 6, 0, 0xC),  # ORI r6, r0, 0xC
+        assemble_i_type(0xA, 1, 0, 0xF),  # ORI r1, r0, 0xF
+        assemble_i_type(0x8, 1, 1, 0x2),  # ADDI r1, r1, 2 (C=1)
+        assemble_branch(0x3, 0x01),  # BCC +1 (not taken)
+        assemble_i_type(0xA, 7, 0, 0xD),  # ORI r7, r0, 0xD
+    ]
+)
+
+# Backward branch: count r2 up while r1 counts down from 3
+_PROG_BRANCH_BACKWARD = pack_program(
+    [
+        assemble_i_type(0xA, 1, 0, 0x3),  # ORI r1, r0, 0x3
+        assemble_i_type(0x8, 2, 2, 0x1),  # loop: ADDI r2, r2, 1
+        assemble_i_type(0x8, 1, 1, 0xF),  # ADDI r1, r1, -1
+        assemble_branch(0x1, -3),  # BNE loop
+    ]
+)
+
+# ADDI/SLTI with negative immediates, following the spec's ADDI examples
+# (risc4-isa-spec.tex:1174-1176): the immediate is a signed addend, so C
+# is set only on a real borrow. The note at :1183, where 3 + 0xF sets C,
+# describes an unsigned add and is not followed. Flags are checked after
+# the last instruction of each program.
+_PROG_ADDI_DEC_ZERO = pack_program(
+    [
+        assemble_i_type(0xA, 3, 0, 0x1),  # ORI r3, r0, 0x1
+        assemble_i_type(0x8, 3, 3, 0xF),  # ADDI r3, r3, -1 → 0, C=0, Z=1
+    ]
+)
+
+_PROG_ADDI_DEC_BORROW = pack_program(
+    [
+        assemble_i_type(0xA, 3, 0, 0x0),  # ORI r3, r0, 0x0
+        assemble_i_type(0x8, 3, 3, 0xF),  # ADDI r3, r3, -1 → 0xF, C=1, Z=0
+    ]
+)
+
+_PROG_SLTI_NEGATIVE = pack_program(
+    [
+        assemble_i_type(0xA, 2, 0, 0xE),  # ORI r2, r0, 0xE (-2)
+        assemble_i_type(0xA, 3, 0, 0x1),  # ORI r3, r0, 0x1
+        assemble_i_type(0xB, 4, 2, 0xF),  # SLTI r4, r2, -1 → 1 (-2 < -1)
+        assemble_i_type(0xB, 5, 2, 0xD),  # SLTI r5, r2, -3 → 0 (-2 > -3)
+        assemble_i_type(0xB, 6, 3, 0xF),  # SLTI r6, r3, -1 → 0 (1 > -1)
+    ]
+)
+
+# SHF, per the spec examples at risc4-isa-spec.tex:1050-1060. imm4 bit 3
+# picks the direction, bits 0-2 the amount; C is the last bit shifted out.
+_PROG_SHF_LEFT_1 = pack_program(
+    [
+        assemble_i_type(0xA, 2, 0, 0xA),  # ORI r2, r0, 0b1010
+        assemble_i_type(0x6, 1, 2, 0x1),  # SHF r1, r2, 0x1 → 0b0100, C=1, Z=0
+    ]
+)
+
+_PROG_SHF_RIGHT_1 = pack_program(
+    [
+        assemble_i_type(0xA, 2, 0, 0xA),  # ORI r2, r0, 0b1010
+        assemble_i_type(0x6, 1, 2, 0x9),  # SHF r1, r2, 0x9 → 0b0101, C=0, Z=0
+    ]
+)
+
+_PROG_SHF_RIGHT_2 = pack_program(
+    [
+        assemble_i_type(0xA, 2, 0, 0xC),  # ORI r2, r0, 0b1100
+        assemble_i_type(0x6, 1, 2, 0xA),  # SHF r1, r2, 0xA → 0b0011, C=0, Z=0
+    ]
+)
+
+_PROG_SHF_LEFT_4 = pack_program(
+    [
+        assemble_i_type(0xA, 2, 0, 0xF),  # ORI r2, r0, 0xF
+        assemble_i_type(0x6, 1, 2, 0x4),  # SHF r1, r2, 0x4 → 0, Z=1 (C unspecified)
+    ]
+)
+
+# Shifting a 4-bit value left by 5-7 leaves only zeros, so the last bit
+# shifted out is a shifted-in 0
+_PROG_SHF_LEFT_5_TO_7 = pack_program(
+    [
+        assemble_i_type(0xA, 2, 0, 0xF),  # ORI r2, r0, 0xF
+        assemble_i_type(0x6, 3, 2, 0x5),  # SHF r3, r2, 0x5 → 0
+        assemble_i_type(0x6, 4, 2, 0x6),  # SHF r4, r2, 0x6 → 0
+        assemble_i_type(0x6, 1, 2, 0x7),  # SHF r1, r2, 0x7 → 0, C=0, Z=1
+    ]
+)
+
+# name -> (program, register checks, memory checks). A register check
+# key may be a tuple of registers, read together through reg_concat(),
+# or "C"/"Z" for a flag.
+CASES = {
+    # 8-bit addition: r6:r1 = r2:r3 + r4:r5 = 0x9F + 0x23
+    "multiprecision_add": (_PROG_MULTIADD, {(6, 1): 0xC2}, {}),
+    # BEQ skips the two ORIs in its shadow
+    "branch": (_PROG_BRANCH, {4: 0x0, 5: 0x0, 6: 0x7}, {}),
+    "bne_taken": (_PROG_BNE_TAKEN, {4: 0x0, 6: 0x7}, {}),
+    "bcs_taken": (_PROG_BCS_TAKEN, {4: 0x0, 6: 0x7}, {}),
+    "bcc_taken": (_PROG_BCC_TAKEN, {4: 0x0, 6: 0x7}, {}),
+    "branch_not_taken": (
+        _PROG_BRANCH_NOT_TAKEN,
+        {4: 0xA, 5: 0xB, 6: 0xC, 7: 0xD},
+        {},
+    ),
+    "branch_backward": (_PROG_BRANCH_BACKWARD, {1: 0x0, 2: 0x3}, {}),
+    # LW/SW through the r14:r15 register pair
+    "load_store": (_PROG_LOAD_STORE, {1: 0xA, 2: 0xA}, {0x80: 0xA}),
+    # JAL saves return index 2 in r1:r2:r3, JR comes back to the ORI
+    "jal_jr": (_PROG_JAL_JR, {(1, 2, 3): 0x002, 4: 0x4, 5: 0x9}, {}),
+    "addi_dec_zero": (_PROG_ADDI_DEC_ZERO, {3: 0x0, "C": 0, "Z": 1}, {}),
+    "addi_dec_borrow": (_PROG_ADDI_DEC_BORROW, {3: 0xF, "C": 1, "Z": 0}, {}),
+    "slti_negative": (_PROG_SLTI_NEGATIVE, {4: 1, 5: 0, 6: 0}, {}),
+    "shf_left_1": (_PROG_SHF_LEFT_1, {1: 0x4, "C": 1, "Z": 0}, {}),
+    "shf_right_1": (_PROG_SHF_RIGHT_1, {1: 0x5, "C": 0, "Z": 0}, {}),
+    "shf_right_2": (_PROG_SHF_RIGHT_2, {1: 0x3, "C": 0, "Z": 0}, {}),
+    "shf_left_4": (_PROG_SHF_LEFT_4, {1: 0x0, "Z": 1}, {}),
+    "shf_left_5_to_7": (
+        _PROG_SHF_LEFT_5_TO_7,
+        {3: 0x0, 4: 0x0, 1: 0x0, "C": 0, "Z": 1},
+        {},
+    ),
+}
+
+
+# Every case runs on both cores: stepping the decode.RISC4 handlers, and
+# the sim_run loop (the Numba kernels when they are available)
+CORES = ("python", "sim_run")
+
+
+def run_and_check(program, checks, mem_checks, core="python"):
+    """Run a straight-line packed program on the shared CPU and check it.
+
+    The Python core fetches from the program image through attach_rom();
+    sim_run only fetches from memory, so the program is loaded there.
+    Execution stops once PC runs past the last instruction. Returns the cpu.
+    """
+    cpu = _CPU
+    cpu.reset()
+    end_pc = 2 * len(program)  # Two nibbles per byte
+
+    if core == "sim_run":
+        load_program(cpu, program)
+        sim_run(cpu, MAX_CYCLES, halt_pc=end_pc)
+    else:
+        cpu.attach_rom(program)
+        trace = []
+        cycle = 0
+        while cpu.pc != end_pc and cycle < MAX_CYCLES:
+            pc_before = cpu.pc
+            instr = cpu.fetch()
+            cpu.decode_and_execute(instr)
+            if TRACE:
+                trace.append((cycle, pc_before, instr, cpu.reg.tolist(), cpu.flag_c))
+            cycle += 1
+        if TRACE:
+            print(
+                "\n".join(
+                    f"[{i}] PC={pc:03X} 0x{instr:04X} → "
+                    + " ".join(f"r{n}={v:X}" for n, v in enumerate(r) if n)
+                    + f" C={c}"
+                    for i, pc, instr, r, c in trace
+                )
+            )
+
+    assert cpu.pc == end_pc, f"did not finish: PC=0x{cpu.pc:03X}"
+    for regs, expected in checks.items():
+        if regs in ("C", "Z"):
+            actual = cpu.flag_c if regs == "C" else cpu.flag_z
+            name = regs
+        else:
+            regs = regs if isinstance(regs, tuple) else (regs,)
+            actual = reg_concat(cpu, regs)
+            name = ":".join(f"r{r}" for r in regs)
+        assert actual == expected, f"{name} = 0x{actual:X}, expected 0x{expected:X}"
+    for addr, expected in mem_checks.items():
+        actual = cpu.memory[addr]
+        assert (
+            actual == expected
+        ), f"mem[0x{addr:02X}] = 0x{actual:X}, expected 0x{expected:X}"
+    return cpu
+
+
+def _run(name):
+    """Run one case on every core, returning everything it printed.
+
+    If it fails, what it printed so far is written out before re-raising.
+    """
+    out = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(out):
+            for core in CORES:
+                run_and_check(*CASES[name], core)
+                print(f"PASS {name} ({core})")
+    except BaseException:
+        sys.stdout.write(out.getvalue())
+        raise
+    return out.getvalue()
+
+
+if __name__ == "__main__":
+    # The pytest suite lives in test_sim.py and runs these same CASES
+    # Each case runs in microseconds, so a worker pool costs more in process
+    # start-up and per-worker Numba dispatcher loading than it saves
+    for name in CASES:
+        print(_run(name), end="")
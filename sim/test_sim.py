@@ -0,0 +1,124 @@
+import pytest
+
+import bubble
+import decode
+from test import (
+    CASES,
+    CORES,
+    MAX_CYCLES,
+    assemble_branch,
+    assemble_branch_vec,
+    assemble_ext,
+    assemble_ext_vec,
+    assemble_i_type,
+    assemble_i_type_vec,
+    assemble_j_type,
+    assemble_j_type_vec,
+    assemble_m_type,
+    assemble_m_type_vec,
+    assemble_r_type,
+    assemble_r_type_vec,
+    load_program,
+    pack_program,
+    run_and_check,
+    sim_run,
+)
+
+
+@pytest.mark.parametrize("core", CORES)
+@pytest.mark.parametrize(
+    "program,checks,mem_checks", list(CASES.values()), ids=list(CASES)
+)
+def test_program(program, checks, mem_checks, core):
+    run_and_check(program, checks, mem_checks, core)
+
+
+@pytest.mark.parametrize(
+    "program", [case[0] for case in CASES.values()], ids=list(CASES)
+)
+def test_cython_core(program):
+    """The Cython core, when built, ends each case in the same state"""
+    decode_core = pytest.importorskip("decode_core")
+    ref = run_and_check(program, {}, {})
+    cpu = decode_core.RISC4()
+    cpu.attach_rom(program)
+    cpu.run(MAX_CYCLES, 2 * len(program))
+    assert bytes(cpu.state) == bytes(ref.state)
+    assert cpu.memory == ref.memory
+
+
+@pytest.mark.parametrize(
+    "instr",
+    [assemble_m_type(0xC, 1, 15, 0), assemble_m_type(0xD, 1, 15, 0)],
+    ids=["lw", "sw"],
+)
+def test_pair_base_r15(instr):
+    """r15 has no neighbour to pair with, so LW/SW through it must fail"""
+    cpu = decode.RISC4()
+    load_program(cpu, [instr])
+    with pytest.raises(IndexError):
+        cpu.decode_and_execute(cpu.fetch())
+    cpu.pc = 0
+    with pytest.raises(IndexError):
+        sim_run(cpu, 1)
+
+
+def test_sim_run_fetch_past_memory():
+    """Running off the end of memory raises instead of reading past it"""
+    cpu = decode.RISC4()
+    with pytest.raises(IndexError):
+        sim_run(cpu, 20000)
+
+
+def test_rom_rejected_by_memory_fetch():
+    """Loops that fetch straight from memory refuse a cpu with ROM attached"""
+    cpu = decode.RISC4()
+    cpu.attach_rom(pack_program([assemble_i_type(0xA, 1, 0, 0x5)]))
+    with pytest.raises(ValueError):
+        sim_run(cpu, MAX_CYCLES)
+    with pytest.raises(ValueError):
+        bubble.run(cpu, MAX_CYCLES)
+
+
+def test_bubble_run_traces_python_core_only():
+    """bubble.run hands the Cython core to its own loop, which has no trace"""
+    decode_core = pytest.importorskip("decode_core")
+    cpu = decode_core.RISC4()
+    assert bubble.run(cpu, 10) == 10
+    with pytest.raises(TypeError):
+        bubble.run(cpu, 10, trace=True)
+
+
+def test_vec_assemblers():
+    """Batch assemblers match the scalar ones for every field combination"""
+    np = pytest.importorskip("numpy")
+    op, a, b, c = np.indices((16, 16, 16, 16)).reshape(4, -1)
+    target12 = (a << 8) | (b << 4) | c
+    offset8 = (b << 4) | c
+    cases = [
+        (assemble_i_type_vec, assemble_i_type, (op, a, b, c)),
+        (assemble_r_type_vec, assemble_r_type, (op, a, b, c)),
+        (assemble_m_type_vec, assemble_m_type, (op, a, b, c)),
+        (assemble_ext_vec, assemble_ext, (a, b, c)),
+        (assemble_j_type_vec, assemble_j_type, (op, target12)),
+        (assemble_branch_vec, assemble_branch, (a, offset8)),
+    ]
+    for vec, scalar, fields in cases:
+        expected = [scalar(*f) for f in zip(*(field.tolist() for field in fields))]
+        assert vec(*fields).tolist() == expected, vec.__name__
+
+
+def test_vec_assemblers_mask_fields():
+    """Out-of-range and negative fields wrap to a nibble in both forms"""
+    np = pytest.importorskip("numpy")
+    values = np.array([-17, -1, 0, 7, 15, 16, 31])
+    op, a, b, c = values[np.indices((len(values),) * 4).reshape(4, -1)]
+    cases = [
+        (assemble_i_type_vec, assemble_i_type, (op, a, b, c)),
+        (assemble_r_type_vec, assemble_r_type, (op, a, b, c)),
+        (assemble_m_type_vec, assemble_m_type, (op, a, b, c)),
+        (assemble_ext_vec, assemble_ext, (a, b, c)),
+    ]
+    for vec, scalar, fields in cases:
+        expected = [scalar(*f) for f in zip(*(field.tolist() for field in fields))]
+        assert vec(*fields).tolist() == expected, vec.__name__